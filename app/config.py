@@ -14,20 +14,25 @@ class Settings(BaseSettings):
 
     # ── Runtime ───────────────────────────────────────────────
     device: str = "cuda"
-    mixed_precision: str = "fp16"  # "no" | "fp16" | "bf16"
+    mixed_precision: str = "auto"  # "auto" | "no" | "fp16" | "bf16"
     num_inference_steps: int = 50
     guidance_scale: float = 2.5
     seed: int = 42
     output_height: int = 1024
     output_width: int = 768
+    channels_last: bool = True  # NHWC layout for UNet + VAE convs
+    compile_unet: bool = False  # torch.compile UNet + VAE decoder (slow first call)
+    warmup_on_startup: bool = True  # 1-step dummy run before serving
 
     # ── Phase 2: Preprocessing ────────────────────────────────
+    enable_person_detection: bool = False # person preprocessing is crop-only
     enable_bg_removal: bool = True       # rembg garment bg removal (CPU)
     enable_face_restoration: bool = False # CodeFormer (disabled — no VRAM)
 
     # ── Paths ─────────────────────────────────────────────────
     catvton_dir: str = ""  # Auto-detected
     models_cache_dir: str = os.path.expanduser("~/tryon_models")
+    fast_cache_dir: str = ""  # e.g. /dev/shm/tryon_models – staged copy of weights
     tmp_dir: str = "/tmp/tryon"
     output_dir: str = "/tmp/tryon/output"
 
@@ -38,6 +43,7 @@ class Settings(BaseSettings):
     aws_secret_access_key: str = ""
     aws_region: str = "us-east-1"
     result_url_expiry_seconds: int = 3600
+    s3_max_pool_connections: int = 64
 
     # ── API ───────────────────────────────────────────────────
     max_upload_size_mb: int = 20
@@ -46,8 +52,13 @@ class Settings(BaseSettings):
     class Config:
         env_file = ".env"
         extra = "ignore"
+        frozen = True
 
 
-@lru_cache
+@lru_cache(maxsize=None)
 def get_settings() -> Settings:
     return Settings()
+
+
+# Process-wide singleton – import this instead of calling get_settings()
+settings = get_settings()
@@ -2,16 +2,20 @@
 FastAPI application entry point – CatVTON Production Pipeline.
 Models are preloaded at startup via lifespan context manager.
 """
+import asyncio
 import logging
 import os
+import traceback
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-from app.config import get_settings
-from app.models.loader import load_all_models
+from app.config import settings
+from app.models.loader import load_all_models, warmup_models
+from app.preprocessing.garment_preprocess import warmup_background_removal
+from app.queue.tasks import run_in_pipeline_thread
 from app.routers import health, tryon
 
 logging.basicConfig(
@@ -19,20 +23,29 @@ logging.basicConfig(
     format="%(asctime)s | %(levelname)-8s | %(name)s – %(message)s",
 )
 logger = logging.getLogger(__name__)
-settings = get_settings()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Load models on startup, clean up on shutdown."""
-    import traceback
     logger.info("=== CatVTON Virtual Try-On API starting up ===")
     try:
         load_all_models()
     except Exception:
         logger.critical("MODEL LOADING FAILED:\n%s", traceback.format_exc())
         raise
+    if settings.warmup_on_startup:
+        # Warm the thread that will serve requests (compiled CUDA graphs are per thread)
+        await run_in_pipeline_thread(warmup_models)
+
+    # rembg is optional – warm it in a thread so startup isn't blocked on it,
+    # while the first request usually still finds the session loaded.
+    bg_warmup = None
+    if settings.enable_bg_removal:
+        bg_warmup = asyncio.create_task(asyncio.to_thread(warmup_background_removal))
     yield
+    if bg_warmup is not None:
+        bg_warmup.cancel()
     logger.info("=== Shutting down ===")
 
 
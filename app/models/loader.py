@@ -4,20 +4,68 @@ Loads: CatVTON diffusion pipeline + AutoMasker (DensePose + SCHP).
 """
 import logging
 import os
+import re
+import shutil
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, fields
+from typing import Any
+
 import torch
 from huggingface_hub import snapshot_download
 
-from app.config import get_settings
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
-# Global model registry
-_models: dict = {}
 
+@dataclass(frozen=True, slots=True)
+class LoadedModels:
+    """Everything load_all_models produces. Built once, never mutated."""
+    pipeline: Any
+    automasker: Any
+    repo_path: str
+    device: str
+    dtype: torch.dtype
+    settings: Any
+
+
+# Global model registry (None until load_all_models has run)
+_models: LoadedModels | None = None
+
+# CatVTONPipeline pulls its VAE from here, independent of base_model_id
+_VAE_REPO_ID = "stabilityai/sd-vae-ft-mse"
+
+# attn_ckpt_version → sub-folder of the CatVTON repo (mirrors CatVTONPipeline)
+_ATTN_CKPT_DIRS = {
+    "mix": "mix-48k-1024",
+    "vitonhd": "vitonhd-16k-512",
+    "dresscode": "dresscode-16k-512",
+}
+
+# Weight duplicates diffusers skips when the plain .safetensors file exists
+_UNUSED_WEIGHT_PATTERNS = ["*.bin", "*.ckpt", "*.fp16.*", "*non_ema*"]
+
+# Files worth paging in ahead of from_pretrained / torch.load
+_WEIGHT_SUFFIXES = (".safetensors", ".bin", ".pth", ".pkl")
+
+# Staged dir suffix: HF snapshot commit hash, optionally an interrupted copy
+_STAGED_REVISION = re.compile(r"[0-9a-f]{40}(\.partial)?")
+
+
+def _init_weight_dtype(precision: str, device: str) -> torch.dtype:
+    """Convert precision string to torch dtype ("auto" → bf16 where supported)."""
+    if precision == "auto":
+        # Half precision only pays off on the GPU that will run the pipeline
+        if not device.startswith("cuda") or not torch.cuda.is_available():
+            return torch.float32
+        # bf16 has fp32's exponent range – no fp16 overflow on Ampere/Ada.
+        # Check the arch, not is_bf16_supported(): that also counts emulated
+        # bf16, which is slow on Turing/Volta – those get fp16.
+        native_bf16 = torch.cuda.get_device_capability(torch.device(device))[0] >= 8
+        precision = "bf16" if native_bf16 else "fp16"
 
-def _init_weight_dtype(precision: str) -> torch.dtype:
-    """Convert precision string to torch dtype."""
     if precision == "fp16":
         return torch.float16
     elif precision == "bf16":
@@ -25,23 +73,214 @@ def _init_weight_dtype(precision: str) -> torch.dtype:
     return torch.float32
 
 
+@contextmanager
+def _skip_weight_init():
+    """
+    Turn default nn.Module initialisation into a no-op while models are built.
+    Every weight is overwritten by the checkpoint right after construction, so
+    the Kaiming/uniform init is wasted work (same idea as transformers'
+    no_init_weights).
+    """
+    modules = (
+        torch.nn.Linear, torch.nn.Conv2d, torch.nn.LayerNorm,
+        torch.nn.GroupNorm, torch.nn.Embedding,
+    )
+    init_fns = ("kaiming_uniform_", "kaiming_normal_", "uniform_", "normal_")
+
+    saved_resets = {cls: cls.reset_parameters for cls in modules}
+    saved_inits = {name: getattr(torch.nn.init, name) for name in init_fns}
+    try:
+        for cls in modules:
+            cls.reset_parameters = lambda self: None
+        for name in init_fns:
+            setattr(torch.nn.init, name, lambda tensor, *args, **kwargs: tensor)
+        yield
+    finally:
+        for cls, fn in saved_resets.items():
+            cls.reset_parameters = fn
+        for name, fn in saved_inits.items():
+            setattr(torch.nn.init, name, fn)
+
+
+def _enable_hf_transfer():
+    """Route HF downloads through the Rust hf_transfer backend when installed."""
+    import importlib.util
+
+    if importlib.util.find_spec("hf_transfer") is None:
+        logger.warning("hf_transfer not installed – downloads use the slow path. pip install hf_transfer")
+        return
+    os.environ["HF_HUB_ENABLE_HF_TRANSFER"] = "1"
+    # huggingface_hub reads the env var at import time, and diffusers has
+    # usually imported it by now – flip the parsed constant as well.
+    from huggingface_hub import constants
+    constants.HF_HUB_ENABLE_HF_TRANSFER = True
+
+
+def _download_checkpoints() -> dict:
+    """
+    Fetch every HF repo the pipeline needs concurrently.
+    Downloads are network-bound, so they overlap well on threads; the
+    from_pretrained calls inside CatVTONPipeline then hit the local cache.
+    """
+    _enable_hf_transfer()
+    attn_dir = _ATTN_CKPT_DIRS[settings.attn_ckpt_version]
+    downloads = {
+        # Only the selected attention checkpoint + AutoMasker weights are used;
+        # skip the other variants and the example images.
+        "catvton": {
+            "repo_id": settings.catvton_repo_id,
+            "allow_patterns": [f"{attn_dir}/attention/*", "DensePose/*", "SCHP/*"],
+            "ignore_patterns": ["*.png", "*.jpg", "*examples*"],
+        },
+        # Only scheduler + UNet are read from the base model. from_pretrained
+        # prefers the non-variant safetensors, so .bin / fp16 / non-EMA
+        # duplicates are never loaded – don't fetch them.
+        "base": {
+            "repo_id": settings.base_model_id,
+            "allow_patterns": ["scheduler/*", "unet/*"],
+            "ignore_patterns": _UNUSED_WEIGHT_PATTERNS,
+        },
+        "vae": {"repo_id": _VAE_REPO_ID, "ignore_patterns": _UNUSED_WEIGHT_PATTERNS},
+    }
+    with ThreadPoolExecutor(max_workers=len(downloads)) as pool:
+        futures = {name: pool.submit(snapshot_download, **kwargs) for name, kwargs in downloads.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def _snapshot_files(path: str) -> dict:
+    """Relative path → size of every file under path, following HF cache symlinks."""
+    files = {}
+    for root, _, names in os.walk(path):
+        for name in names:
+            full = os.path.join(root, name)
+            files[os.path.relpath(full, path)] = os.path.getsize(full)
+    return files
+
+
+def _readahead(path: str):
+    """Hint the kernel (POSIX_FADV_WILLNEED) to page in every weight file under path."""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    for root, _, files in os.walk(path):
+        for name in files:
+            if not name.endswith(_WEIGHT_SUFFIXES):
+                continue
+            fd = os.open(os.path.join(root, name), os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+
+
+def _has_safetensors(path: str) -> bool:
+    """True if path directly holds a .safetensors weight file."""
+    return os.path.isdir(path) and any(n.endswith(".safetensors") for n in os.listdir(path))
+
+
+def _stage_to_fast_cache(repo_path: str, repo_id: str) -> str:
+    """
+    Copy a downloaded snapshot onto settings.fast_cache_dir (tmpfs / local NVMe)
+    and return the staged path. Falls back to repo_path if space is short.
+    """
+    # Snapshot dir name is the commit hash, so a new revision gets a new copy
+    prefix = f"{repo_id.replace('/', '--')}-"
+    name = prefix + os.path.basename(repo_path)
+    staged = os.path.join(settings.fast_cache_dir, name)
+
+    # The same revision can gain files between runs (allow_patterns depend on
+    # attn_ckpt_version), so diff against the snapshot rather than trusting
+    # an existing stage
+    source = _snapshot_files(repo_path)
+    existing = _snapshot_files(staged) if os.path.isdir(staged) else {}
+    missing = [rel for rel, size in source.items() if existing.get(rel) != size]
+    if not missing:
+        return staged
+
+    needed = sum(source[rel] for rel in missing)
+    free = shutil.disk_usage(settings.fast_cache_dir).free
+    # 2× headroom: on tmpfs the staged copy is RAM, and loading then reads
+    # the same weights into process memory again – keep a second copy's
+    # worth free so staging can't push the load itself into OOM.
+    if free < 2 * needed:
+        logger.warning(
+            "Not staging %s: %.1fGB free on %s, need %.1fGB",
+            repo_id, free / 1024**3, settings.fast_cache_dir, 2 * needed / 1024**3,
+        )
+        return repo_path
+
+    if not existing:
+        # Copy under a temp name first so a crash never leaves a partial stage
+        tmp = f"{staged}.partial"
+        shutil.rmtree(tmp, ignore_errors=True)
+        shutil.copytree(repo_path, tmp)  # symlinks=False → copies blob contents
+        os.replace(tmp, staged)
+        logger.info("Staged %s → %s", repo_id, staged)
+        _remove_stale_stages(prefix, keep=name)
+    else:
+        for rel in missing:
+            dst = os.path.join(staged, rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copyfile(os.path.join(repo_path, rel), f"{dst}.partial")
+            os.replace(f"{dst}.partial", dst)
+        logger.info("Staged %d new file(s) of %s → %s", len(missing), repo_id, staged)
+
+    return staged
+
+
+def _remove_stale_stages(prefix: str, keep: str) -> None:
+    """Delete staged copies of older revisions of the same repo (tmpfs is RAM)."""
+    for entry in os.listdir(settings.fast_cache_dir):
+        if entry == keep or not entry.startswith(prefix):
+            continue
+        # Only <prefix><commit hash>[.partial] – never another repo sharing the prefix
+        if not _STAGED_REVISION.fullmatch(entry[len(prefix):]):
+            continue
+        shutil.rmtree(os.path.join(settings.fast_cache_dir, entry), ignore_errors=True)
+        logger.info("Removed stale staged copy %s", entry)
+
+
 def load_all_models():
     """Load CatVTON pipeline + AutoMasker. Called once at startup."""
-    settings = get_settings()
+    # Must be set before the first CUDA allocation. Expandable segments stop
+    # the VAE's large, varying decode buffers from fragmenting 6GB cards.
+    os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True")
+
     device = settings.device
-    weight_dtype = _init_weight_dtype(settings.mixed_precision)
+    weight_dtype = _init_weight_dtype(settings.mixed_precision, device)
+    precision = str(weight_dtype).removeprefix("torch.")
+    cuda_ok = torch.cuda.is_available()
 
     logger.info("GPU: %s | Device: %s | Precision: %s",
-                torch.cuda.get_device_name(0) if torch.cuda.is_available() else "CPU",
-                device, settings.mixed_precision)
+                torch.cuda.get_device_name(0) if cuda_ok else "CPU",
+                device, precision)
 
-    # ── 1. Download CatVTON checkpoint from HuggingFace ────────
-    logger.info("Downloading CatVTON checkpoint (first run only)...")
-    repo_path = snapshot_download(
-        repo_id=settings.catvton_repo_id,
-    )
+    # ── 1. Download checkpoints from HuggingFace (in parallel) ─
+    logger.info("Downloading CatVTON + base model checkpoints (first run only)...")
+    repo_paths = _download_checkpoints()
+    repo_path = repo_paths["catvton"]
+    base_path = repo_paths["base"]
+    base_ckpt = settings.base_model_id
+    if settings.fast_cache_dir:
+        os.makedirs(settings.fast_cache_dir, exist_ok=True)
+        repo_path = _stage_to_fast_cache(repo_path, settings.catvton_repo_id)
+        if _has_safetensors(os.path.join(base_path, "unet")):
+            base_path = base_ckpt = _stage_to_fast_cache(base_path, settings.base_model_id)
+        else:
+            # .bin / fp16-only repo: the filtered snapshot holds no loadable UNet,
+            # and from a local dir from_pretrained couldn't fetch one – keep the
+            # repo id so it downloads the weights it needs itself
+            logger.warning(
+                "Not staging %s: no plain unet/*.safetensors in the snapshot",
+                settings.base_model_id,
+            )
     logger.info("CatVTON checkpoint at: %s", repo_path)
-    _models["repo_path"] = repo_path
+
+    # Page weight files in on a background thread while the main thread
+    # imports CatVTON and builds modules, so the reads below hit the cache.
+    readahead_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="readahead")
+    for path in (base_path, repo_paths["vae"], repo_path):
+        readahead_pool.submit(_readahead, path)
+    readahead_pool.shutdown(wait=False)
 
     # ── 2. Find CatVTON source directory ───────────────────────
     # loader.py is at app/models/loader.py → 3 levels up to project root
@@ -62,53 +301,116 @@ def load_all_models():
         )
     logger.info("CatVTON source at: %s", catvton_dir)
 
-    # Add CatVTON to Python path so its imports work
-    if catvton_dir not in sys.path:
+    # Add CatVTON to Python path so its imports work. Its modules import each
+    # other absolutely (model.*, utils, detectron2, densepose), so it has to
+    # be a real sys.path root. start_wsl.sh usually exports it on PYTHONPATH
+    # already – compare resolved paths so it isn't added a second time.
+    catvton_dir = os.path.realpath(catvton_dir)
+    if catvton_dir not in {os.path.realpath(p) for p in sys.path if p}:
         sys.path.insert(0, catvton_dir)
 
     # ── 3. Load CatVTON Pipeline ───────────────────────────────
     from model.pipeline import CatVTONPipeline  # noqa: E402
 
+    # Input shape is fixed (output_width × output_height), so cuDNN's
+    # per-shape algorithm search pays off after the first call.
+    torch.backends.cudnn.benchmark = True
+
     logger.info("Loading CatVTON pipeline (base: %s)...", settings.base_model_id)
-    pipeline = CatVTONPipeline(
-        base_ckpt=settings.base_model_id,
-        attn_ckpt=repo_path,
-        attn_ckpt_version=settings.attn_ckpt_version,
-        weight_dtype=weight_dtype,
-        device=device,
-        skip_safety_check=True,  # We handle safety ourselves
-        use_tf32=True,
-    )
-    _models["pipeline"] = pipeline
-    logger.info("CatVTON pipeline loaded (%s)", settings.mixed_precision)
+    with _skip_weight_init():
+        pipeline = CatVTONPipeline(
+            base_ckpt=base_ckpt,
+            attn_ckpt=repo_path,
+            attn_ckpt_version=settings.attn_ckpt_version,
+            weight_dtype=weight_dtype,
+            device=device,
+            skip_safety_check=True,  # We handle safety ourselves
+            use_tf32=True,
+        )
+
+    if settings.channels_last:
+        # NHWC matches cuDNN's tensor-core conv kernels. Latents built inside
+        # CatVTONPipeline stay NCHW; the first conv converts them.
+        pipeline.unet.to(memory_format=torch.channels_last)
+        pipeline.vae.to(memory_format=torch.channels_last)
+
+    if settings.compile_unet:
+        # Shapes never change, so Inductor + CUDA graphs compile once and the
+        # cost is absorbed at startup (first forward triggers compilation).
+        torch._inductor.config.conv_1x1_as_mm = True
+        pipeline.unet = torch.compile(pipeline.unet, mode="reduce-overhead", fullgraph=False)
+        pipeline.vae.decoder = torch.compile(pipeline.vae.decoder, mode="reduce-overhead", fullgraph=False)
+        logger.info("CatVTON UNet + VAE decoder wrapped with torch.compile (reduce-overhead)")
+
+    logger.info("CatVTON pipeline loaded (%s)", precision)
 
     # ── 4. Load AutoMasker (DensePose + SCHP) ──────────────────
     from model.cloth_masker import AutoMasker  # noqa: E402
 
     logger.info("Loading AutoMasker (DensePose + SCHP)...")
-    automasker = AutoMasker(
-        densepose_ckpt=os.path.join(repo_path, "DensePose"),
-        schp_ckpt=os.path.join(repo_path, "SCHP"),
-        device=device,
-    )
-    _models["automasker"] = automasker
+    with _skip_weight_init():
+        automasker = AutoMasker(
+            densepose_ckpt=os.path.join(repo_path, "DensePose"),
+            schp_ckpt=os.path.join(repo_path, "SCHP"),
+            device=device,
+        )
     logger.info("AutoMasker loaded")
 
-    # ── 5. Store metadata ──────────────────────────────────────
-    _models["device"] = device
-    _models["dtype"] = weight_dtype
-    _models["settings"] = settings
+    # ── 5. Publish registry ────────────────────────────────────
+    global _models
+    _models = LoadedModels(
+        pipeline=pipeline,
+        automasker=automasker,
+        repo_path=repo_path,
+        device=device,
+        dtype=weight_dtype,
+        settings=settings,
+    )
 
-    vram = torch.cuda.get_device_properties(0).total_memory / 1024**3 if torch.cuda.is_available() else 0
+    vram = torch.cuda.get_device_properties(0).total_memory / 1024**3 if cuda_ok else 0
     logger.info("=== All models loaded | VRAM: %.1fGB | CatVTON | DensePose+SCHP ===", vram)
 
 
+def warmup_models():
+    """
+    Run a single diffusion step on blank inputs at the real output size, so
+    CUDA context setup, cuDNN autotuning and torch.compile (if enabled) happen
+    at startup instead of on the first user request. Failures are logged only.
+    Skipped on CPU – there's no CUDA/cuDNN state to warm, only a slow dummy run.
+    """
+    from PIL import Image
+
+    if not torch.cuda.is_available() or not str(get_model("device")).startswith("cuda"):
+        logger.info("Skipping warmup: not running on CUDA")
+        return
+
+    pipeline = get_model("pipeline")
+    size = (settings.output_width, settings.output_height)
+
+    logger.info("Warming up CatVTON pipeline (1 step at %dx%d)...", *size)
+    try:
+        pipeline(
+            image=Image.new("RGB", size, (255, 255, 255)),
+            condition_image=Image.new("RGB", size, (255, 255, 255)),
+            mask=Image.new("L", size, 255),
+            num_inference_steps=1,
+            guidance_scale=settings.guidance_scale,  # same CFG batch shape as requests
+            height=settings.output_height,
+            width=settings.output_width,
+        )
+        torch.cuda.synchronize()
+        logger.info("Warmup complete")
+    except Exception as exc:
+        logger.warning("Warmup pass failed (first request will be slow): %s", exc)
+
+
 def get_model(key: str, optional: bool = False):
     """Get a loaded model by key."""
-    if key not in _models:
+    if _models is None or not hasattr(_models, key):
         if optional:
             return None
+        available = [f.name for f in fields(LoadedModels)] if _models is not None else []
         raise RuntimeError(
-            f"Model '{key}' not loaded. Available: {list(_models.keys())}"
+            f"Model '{key}' not loaded. Available: {available}"
         )
-    return _models[key]
+    return getattr(_models, key)
@@ -14,6 +14,8 @@ logger = logging.getLogger(__name__)
 class PipelineMonitor:
     """
     Context manager that captures performance metrics for a pipeline run.
+    CUDA synchronize / peak-memory stats are process-wide, so this assumes one
+    run at a time – true while runs go through the single pipeline thread.
 
     Usage:
         with PipelineMonitor(request_id="abc") as mon:
@@ -3,15 +3,23 @@ Garment image preprocessing – Phase 2.
 Removes background, crops to garment region, centers and resizes.
 """
 import logging
+import threading
 
+import cv2
 import numpy as np
-from PIL import Image, ImageOps
+from PIL import Image
+
+from app.utils.image import ensure_mode, exif_upright, resize_and_pad
 
 logger = logging.getLogger(__name__)
 
 # Target size for CatVTON (width, height)
 TARGET_SIZE = (768, 1024)
 
+# rembg U2Net session, built on first use (see _get_rembg_session)
+_rembg_session = None
+_rembg_session_lock = threading.Lock()
+
 
 def preprocess_garment(
     image: Image.Image,
@@ -38,7 +46,7 @@ def preprocess_garment(
           - "bg_removed": bool
     """
     # ── 1. Fix EXIF rotation ───────────────────────────────────
-    image = ImageOps.exif_transpose(image)
+    image = exif_upright(image)
     original_size = image.size
 
     meta = {
@@ -60,13 +68,37 @@ def preprocess_garment(
     # ── 3. Crop to garment region ──────────────────────────────
     image = _crop_to_content(image)
 
-    # ── 4. Center on white canvas + resize ─────────────────────
-    image = _center_and_resize(image, TARGET_SIZE)
+    # ── 4. Center on white canvas + resize (use 90% of canvas) ─
+    image = resize_and_pad(image, TARGET_SIZE, margin=0.9)
     meta["image"] = image
 
     return meta
 
 
+def _get_rembg_session():
+    """Create the rembg U2Net session once – loading the ONNX model is slow."""
+    global _rembg_session
+    if _rembg_session is None:
+        # Locked so a request racing the startup warmup waits for its session
+        # instead of loading a second one
+        with _rembg_session_lock:
+            if _rembg_session is None:
+                from rembg import new_session
+                _rembg_session = new_session("u2net")
+    return _rembg_session
+
+
+def warmup_background_removal():
+    """Load the rembg session ahead of the first request (safe to run in a thread)."""
+    try:
+        _get_rembg_session()
+        logger.info("rembg session ready")
+    except ImportError:
+        logger.warning("rembg not installed – garment background removal disabled")
+    except Exception as exc:
+        logger.warning("rembg warmup failed: %s", exc)
+
+
 def _remove_background(image: Image.Image) -> Image.Image | None:
     """Remove background using rembg (U2Net). Returns RGBA image or None."""
     try:
@@ -78,20 +110,20 @@ def _remove_background(image: Image.Image) -> Image.Image | None:
         return None
 
     # rembg returns RGBA with transparent background
-    result = remove(image)
+    result = remove(image, session=_get_rembg_session())
 
     # Convert transparent → white background
     if result.mode == "RGBA":
         white_bg = Image.new("RGB", result.size, (255, 255, 255))
-        white_bg.paste(result, mask=result.split()[3])
+        white_bg.paste(result, mask=result)  # RGBA mask → uses alpha band
         return white_bg
 
-    return result.convert("RGB")
+    return ensure_mode(result, "RGB")
 
 
 def _crop_to_content(image: Image.Image) -> Image.Image:
     """Crop to the non-white bounding box of the garment."""
-    img_arr = np.array(image)
+    img_arr = np.asarray(image)  # one copy (tobytes) instead of np.array's two
 
     # Find non-white pixels (threshold: < 240 in any channel)
     if img_arr.ndim == 3:
@@ -99,14 +131,13 @@ def _crop_to_content(image: Image.Image) -> Image.Image:
     else:
         mask = img_arr < 240
 
-    if not mask.any():
+    # Tight bbox in one SIMD pass; bool → uint8 is a free view
+    x_min, y_min, bw, bh = cv2.boundingRect(mask.view(np.uint8))
+    if bw == 0:
         # All white — return as-is
         return image
-
-    rows = np.any(mask, axis=1)
-    cols = np.any(mask, axis=0)
-    y_min, y_max = np.where(rows)[0][[0, -1]]
-    x_min, x_max = np.where(cols)[0][[0, -1]]
+    x_max = x_min + bw - 1
+    y_max = y_min + bh - 1
 
     # Add small padding (5% of dimensions)
     h, w = img_arr.shape[:2]
@@ -119,25 +150,3 @@ def _crop_to_content(image: Image.Image) -> Image.Image:
     y_max = min(h, y_max + pad_y)
 
     return image.crop((x_min, y_min, x_max, y_max))
-
-
-def _center_and_resize(
-    image: Image.Image,
-    target_size: tuple,
-) -> Image.Image:
-    """Resize garment maintaining aspect ratio, center on white canvas."""
-    tw, th = target_size
-
-    # Resize to fit within target (leave some margin)
-    margin = 0.9  # use 90% of canvas
-    max_w = int(tw * margin)
-    max_h = int(th * margin)
-    image.thumbnail((max_w, max_h), Image.LANCZOS)
-
-    # Create white canvas and paste centered
-    canvas = Image.new("RGB", (tw, th), (255, 255, 255))
-    x_off = (tw - image.width) // 2
-    y_off = (th - image.height) // 2
-    canvas.paste(image, (x_off, y_off))
-
-    return canvas
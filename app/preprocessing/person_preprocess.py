@@ -4,7 +4,9 @@ EXIF fix, center crop to portrait, resize to model input. All CPU, no GPU load.
 """
 import logging
 
-from PIL import Image, ImageOps
+from PIL import Image
+
+from app.utils.image import exif_upright, resize_and_pad
 
 logger = logging.getLogger(__name__)
 
@@ -28,14 +30,14 @@ def preprocess_person(image: Image.Image) -> dict:
           - "original_size": (w, h)
     """
     # ── 1. Fix EXIF rotation ───────────────────────────────────
-    image = ImageOps.exif_transpose(image)
+    image = exif_upright(image)
     original_size = image.size  # (w, h)
 
     # ── 2. Center crop to portrait ratio ───────────────────────
     image = _center_crop_portrait(image)
 
     # ── 3. Resize + pad to target ──────────────────────────────
-    image = _resize_and_pad(image, TARGET_SIZE)
+    image = resize_and_pad(image, TARGET_SIZE)
 
     logger.info("Person preprocessed: %s → 768×1024", original_size)
 
@@ -63,16 +65,3 @@ def _center_crop_portrait(image: Image.Image) -> Image.Image:
         image = image.crop((0, offset, w, offset + new_h))
 
     return image
-
-
-def _resize_and_pad(image: Image.Image, target_size: tuple) -> Image.Image:
-    """Resize maintaining aspect ratio, then white-pad to exact target size."""
-    tw, th = target_size
-    image.thumbnail((tw, th), Image.LANCZOS)
-
-    canvas = Image.new("RGB", (tw, th), (255, 255, 255))
-    x_off = (tw - image.width) // 2
-    y_off = (th - image.height) // 2
-    canvas.paste(image, (x_off, y_off))
-
-    return canvas
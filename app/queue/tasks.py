@@ -3,22 +3,65 @@ Pipeline orchestration – CatVTON Production Pipeline (Phase 2 slim).
 Pipeline: Preprocess → AutoMasker → CatVTON Diffusion → Output
 No extra GPU models loaded — preprocessing is CPU only.
 """
-import io
+import asyncio
+import functools
+import hashlib
 import logging
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import torch
 from diffusers.image_processor import VaeImageProcessor
 from PIL import Image
 
+from app.config import settings
 from app.models.loader import get_model
 from app.monitoring.monitor import PipelineMonitor
 from app.preprocessing.person_preprocess import preprocess_person
 from app.preprocessing.garment_preprocess import preprocess_garment
+from app.storage import s3
+from app.utils.image import encode_image_base64, ensure_mode
 
 logger = logging.getLogger(__name__)
 
+# API garment category → AutoMasker mask_type
+_MASK_TYPES = {
+    "upper": "upper",
+    "lower": "lower",
+    "full": "overall",
+    "overall": "overall",
+}
+
+# Stateless mask post-processor, shared across requests
+_mask_processor = VaeImageProcessor(
+    vae_scale_factor=8,
+    do_normalize=False,
+    do_binarize=True,
+    do_convert_grayscale=True,
+)
+
+
+# AutoMasker output for recently seen person images (retries, multi-garment)
+_MASK_CACHE_SIZE = 16
+_mask_cache: OrderedDict = OrderedDict()
+_mask_cache_lock = threading.Lock()
+
+# Garment preprocessing (rembg, CPU) runs here while the person goes through
+# AutoMasker on the GPU
+_preprocess_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="preprocess")
+
+# One RNG per device, re-seeded per request instead of allocated per request
+_generators: dict = {}
+
+# Every pipeline run (and the startup warmup) happens on this one thread:
+# requests queue here instead of fighting over VRAM, the shared generator and
+# PipelineMonitor's process-wide CUDA stats see one run at a time, and
+# torch.compile's per-thread CUDA graphs are warmed on the thread that serves
+_pipeline_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pipeline")
+
 
 class PipelineError(Exception):
     """Structured pipeline error with code."""
@@ -28,56 +71,124 @@ class PipelineError(Exception):
         super().__init__(message)
 
 
+def _seeded_generator(device: str, seed: int) -> torch.Generator:
+    """Return the cached generator for device, reset to seed."""
+    generator = _generators.get(device)
+    if generator is None:
+        generator = _generators[device] = torch.Generator(device=device)
+    return generator.manual_seed(seed)
+
+
+def _get_agnostic_mask(automasker, person_image: Image.Image, mask_type: str) -> Image.Image:
+    """
+    Run AutoMasker, memoised on the preprocessed person pixels + mask type.
+    Callers must not modify the returned mask in place (blur/convert copy).
+    """
+    key = (hashlib.blake2b(person_image.tobytes(), digest_size=16).digest(), mask_type)
+    with _mask_cache_lock:
+        mask = _mask_cache.get(key)
+        if mask is not None:
+            _mask_cache.move_to_end(key)
+            logger.info("AutoMasker cache hit (%s)", mask_type)
+            return mask
+
+    with torch.inference_mode():
+        mask = automasker(person_image, mask_type=mask_type)["mask"]
+
+    with _mask_cache_lock:
+        _mask_cache[key] = mask
+        if len(_mask_cache) > _MASK_CACHE_SIZE:
+            _mask_cache.popitem(last=False)
+    return mask
+
+
+async def run_in_pipeline_thread(fn, *args, **kwargs):
+    """Await fn(*args, **kwargs) on the dedicated pipeline thread."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _pipeline_executor, functools.partial(fn, *args, **kwargs)
+    )
+
+
+def _discard(future, job_id: str) -> None:
+    """Cancel a preprocessing job nobody will wait for; log its error if it ran."""
+    if future.cancel():
+        return
+
+    def _log_error(f):
+        if not f.cancelled() and f.exception() is not None:
+            logger.warning(
+                "[%s] Discarded garment preprocessing failed: %s",
+                job_id, f.exception(),
+            )
+
+    future.add_done_callback(_log_error)
+
+
 def run_tryon_pipeline_sync(
-    person_image_bytes: bytes,
-    clothing_image_bytes: bytes,
+    person_image: Image.Image,
+    clothing_image: Image.Image,
     job_id: str,
     garment_category: str = "upper",
 ) -> dict:
     """
     Run the full CatVTON virtual try-on pipeline synchronously.
+    Takes already-decoded RGB images (see load_image_from_upload).
 
     Pipeline (all preprocessing is CPU, only AutoMasker + CatVTON use GPU):
-      1. Person image: EXIF fix → center crop → resize to 768×1024  [CPU]
-      2. Garment image: bg removal (rembg) → crop → center → resize  [CPU]
+      1. Garment image: bg removal (rembg) → crop → center → resize  [CPU]
+      2. Person image: EXIF fix → center crop → resize to 768×1024  [CPU]
       3. AutoMasker: DensePose + SCHP → agnostic mask  [GPU]
       4. CatVTON diffusion → result image  [GPU]
+    Stage 1 runs on a worker thread, overlapping stages 2 + 3.
+    Returns the PIL result under "result_image"; pass it to build_result_output.
     """
     pipeline = get_model("pipeline")
     automasker = get_model("automasker")
-    settings = get_model("settings")
 
-    category_map = {
-        "upper": "upper",
-        "lower": "lower",
-        "full": "overall",
-        "overall": "overall",
-    }
-    mask_type = category_map.get(garment_category, "upper")
+    mask_type = _MASK_TYPES.get(garment_category, "upper")
 
     with PipelineMonitor(request_id=job_id) as monitor:
 
-        # ── Stage 1: Person preprocessing (CPU) ────────────────
-        logger.info("[%s] Stage 1/4 – Person preprocessing", job_id)
+        # ── Stage 1: Garment preprocessing (CPU, background) ───
+        logger.info("[%s] Stage 1/4 – Garment preprocessing (background)", job_id)
+        garment_future = _preprocess_pool.submit(
+            preprocess_garment,
+            clothing_image,
+            enable_bg_removal=settings.enable_bg_removal,
+        )
+
         try:
-            person_img = Image.open(io.BytesIO(person_image_bytes)).convert("RGB")
-        except Exception:
-            raise PipelineError("INVALID_IMAGE", "Could not read person image.")
+            # ── Stage 2: Person preprocessing (CPU) ────────────────
+            logger.info("[%s] Stage 2/4 – Person preprocessing", job_id)
+            person_result = preprocess_person(person_image)
+            person_preprocessed = person_result["image"]
 
-        person_result = preprocess_person(person_img)
-        person_preprocessed = person_result["image"]
+            # ── Stage 3: AutoMasker (GPU – already loaded) ─────────
+            logger.info("[%s] Stage 3/4 – AutoMasker (DensePose + SCHP)", job_id)
+            mask = _get_agnostic_mask(automasker, person_preprocessed, mask_type)
 
-        # ── Stage 2: Garment preprocessing (CPU) ───────────────
-        logger.info("[%s] Stage 2/4 – Garment preprocessing", job_id)
-        try:
-            cloth_img = Image.open(io.BytesIO(clothing_image_bytes)).convert("RGB")
-        except Exception:
-            raise PipelineError("INVALID_IMAGE", "Could not read garment image.")
+            # Validate: if mask is essentially empty, person wasn't detected
+            mask_arr = np.asarray(ensure_mode(mask, "L"))
+            mask_coverage = np.count_nonzero(mask_arr > 128) / mask_arr.size
+            if mask_coverage < 0.01:
+                raise PipelineError(
+                    "PERSON_NOT_DETECTED",
+                    "AutoMasker could not detect a person in the image. "
+                    "Please upload a clear, full-body photo.",
+                )
 
-        garment_result = preprocess_garment(
-            cloth_img,
-            enable_bg_removal=settings.enable_bg_removal,
-        )
+            logger.info("[%s] Mask coverage: %.1f%%", job_id, mask_coverage * 100)
+
+            # Blur mask edges for smoother transitions
+            mask = _mask_processor.blur(mask, blur_factor=9)
+        except BaseException:
+            # Don't leave the garment job holding a pool worker, or its error unseen
+            _discard(garment_future, job_id)
+            raise
+
+        # ── Join Stage 1 ───────────────────────────────────────
+        garment_result = garment_future.result()
         cloth_preprocessed = garment_result["image"]
 
         logger.info(
@@ -85,41 +196,14 @@ def run_tryon_pipeline_sync(
             job_id, person_result["original_size"], garment_result["bg_removed"],
         )
 
-        # ── Stage 3: AutoMasker (GPU – already loaded) ─────────
-        logger.info("[%s] Stage 3/4 – AutoMasker (DensePose + SCHP)", job_id)
-        mask_result = automasker(person_preprocessed, mask_type=mask_type)
-        mask = mask_result["mask"]
-
-        # Validate: if mask is essentially empty, person wasn't detected
-        mask_arr = np.array(mask.convert("L"))
-        mask_coverage = (mask_arr > 128).sum() / mask_arr.size
-        if mask_coverage < 0.01:
-            raise PipelineError(
-                "PERSON_NOT_DETECTED",
-                "AutoMasker could not detect a person in the image. "
-                "Please upload a clear, full-body photo.",
-            )
-
-        logger.info("[%s] Mask coverage: %.1f%%", job_id, mask_coverage * 100)
-
-        # Blur mask edges for smoother transitions
-        mask_processor = VaeImageProcessor(
-            vae_scale_factor=8,
-            do_normalize=False,
-            do_binarize=True,
-            do_convert_grayscale=True,
-        )
-        mask = mask_processor.blur(mask, blur_factor=9)
-
         # ── Stage 4: CatVTON Diffusion (GPU – already loaded) ─
         logger.info(
             "[%s] Stage 4/4 – CatVTON diffusion (%d steps, CFG %.1f)",
             job_id, settings.num_inference_steps, settings.guidance_scale,
         )
 
-        generator = torch.Generator(device="cuda").manual_seed(settings.seed)
-
         try:
+            generator = _seeded_generator(get_model("device"), settings.seed)
             result_images = pipeline(
                 image=person_preprocessed,
                 condition_image=cloth_preprocessed,
@@ -139,13 +223,10 @@ def run_tryon_pipeline_sync(
 
         result_image = result_images[0]
 
-    # ── Build response ─────────────────────────────────────────
-    from app.utils.image import encode_image_base64
-    result_b64 = encode_image_base64(result_image, fmt="PNG")
-
+    # Encoding / upload happens in build_result_output, off this thread
     return {
         "job_id": job_id,
-        "result_image_base64": result_b64,
+        "result_image": result_image,
         "garment_category": garment_category,
         "resolution": f"{settings.output_width}x{settings.output_height}",
         "monitoring": {
@@ -158,3 +239,20 @@ def run_tryon_pipeline_sync(
             "mask_coverage_pct": round(mask_coverage * 100, 1),
         },
     }
+
+
+def build_result_output(result_image: Image.Image, job_id: str) -> dict:
+    """
+    Turn a pipeline result into its response fields: a presigned S3 URL when
+    storage is configured, otherwise (or if the upload fails) inline base64 PNG.
+    Blocking (encode + network) – call it off the pipeline thread so queued
+    runs don't wait on it.
+    """
+    # With S3, return a URL instead of inlining ~2 MB of base64 in the JSON
+    if s3.is_configured():
+        try:
+            key = s3.upload_image(result_image, key=s3.result_key(job_id))
+            return {"result_url": s3.get_presigned_url(key)}
+        except Exception as exc:
+            logger.warning("[%s] S3 upload failed, inlining result: %s", job_id, exc)
+    return {"result_image_base64": encode_image_base64(result_image, fmt="PNG")}
@@ -2,12 +2,13 @@
 Health check router – CatVTON Pipeline (Phase 2).
 """
 import time
+from functools import lru_cache
 
 import torch
 from fastapi import APIRouter
 from fastapi.responses import JSONResponse
 
-from app.config import get_settings
+from app.config import settings
 from app.models.loader import get_model
 
 router = APIRouter(tags=["Health"])
@@ -15,19 +16,31 @@ router = APIRouter(tags=["Health"])
 _start_time = time.time()
 
 
-@router.get("/health")
-async def health():
-    settings = get_settings()
+@lru_cache(maxsize=1)
+def _static_gpu_info() -> dict:
+    """Device name and total memory never change – query CUDA for them once."""
+    if not torch.cuda.is_available():
+        return {}
+    return {
+        "gpu_name": torch.cuda.get_device_name(0),
+        "total_memory_gb": round(
+            torch.cuda.get_device_properties(0).total_memory / 1e9, 2
+        ),
+    }
+
 
+@router.get("/health")
+def health():
+    # Sync handler: FastAPI runs it in the threadpool, off the event loop
+    static_info = _static_gpu_info()
+    cuda_available = bool(static_info)
     gpu_info = {}
-    if torch.cuda.is_available():
+    if cuda_available:
         gpu_info = {
-            "gpu_name": torch.cuda.get_device_name(0),
+            "gpu_name": static_info["gpu_name"],
             "memory_allocated_gb": round(torch.cuda.memory_allocated(0) / 1e9, 2),
             "memory_reserved_gb": round(torch.cuda.memory_reserved(0) / 1e9, 2),
-            "total_memory_gb": round(
-                torch.cuda.get_device_properties(0).total_memory / 1e9, 2
-            ),
+            "total_memory_gb": static_info["total_memory_gb"],
         }
 
     models_loaded = get_model("pipeline", optional=True) is not None
@@ -38,7 +51,7 @@ async def health():
         "pipeline": "CatVTON (ICLR 2025)",
         "models_loaded": models_loaded,
         "automasker_loaded": automasker_loaded,
-        "cuda_available": torch.cuda.is_available(),
+        "cuda_available": cuda_available,
         "gpu": gpu_info,
         "uptime_seconds": round(time.time() - _start_time),
         "preprocessing": {
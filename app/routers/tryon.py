@@ -2,15 +2,25 @@
 Try-On API router – CatVTON Production Pipeline (Phase 2).
 POST /api/tryon → runs full preprocessing + CatVTON pipeline
 """
+import asyncio
 import logging
+import traceback
 import uuid
 from typing import Literal
 
 from fastapi import APIRouter, File, Form, HTTPException, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, RedirectResponse
 
-from app.queue.tasks import PipelineError, run_tryon_pipeline_sync
-from app.utils.image import image_to_bytes, load_image_from_upload
+from app.preprocessing import person_preprocess
+from app.queue.tasks import (
+    PipelineError,
+    build_result_output,
+    run_in_pipeline_thread,
+    run_tryon_pipeline_sync,
+)
+from app.storage import s3
+from app.utils.ids import new_job_id
+from app.utils.image import load_image_from_upload
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/tryon", tags=["Try-On"])
@@ -39,35 +49,46 @@ async def submit_tryon(
       2. Garment preprocessing (bg removal, center, resize)
       3. AutoMasker – pixel-level human parsing (DensePose + SCHP)
       4. CatVTON – diffusion-based garment transfer (1024×768)
-    Returns result image as base64 PNG with monitoring data.
+    Returns the result as a presigned S3 URL (result_url) when storage is
+    configured, otherwise as base64 PNG (result_image_base64), with monitoring data.
     """
-    job_id = str(uuid.uuid4())
+    job_id = new_job_id()
 
     # ── Validate uploads ───────────────────────────────────────
     try:
-        person_pil = await load_image_from_upload(person_image)
-        clothing_pil = await load_image_from_upload(clothing_image)
+        person_pil, clothing_pil = await asyncio.gather(
+            # Person photo is fitted into TARGET_SIZE; never decode it smaller
+            load_image_from_upload(
+                person_image,
+                max_side=max(person_preprocess.TARGET_SIZE),
+            ),
+            load_image_from_upload(clothing_image),
+        )
     except ValueError as exc:
         raise HTTPException(
             status_code=400,
             detail={"error": "INVALID_IMAGE", "message": str(exc), "job_id": job_id},
         )
 
-    person_bytes = image_to_bytes(person_pil)
-    clothing_bytes = image_to_bytes(clothing_pil)
-
     # ── Run pipeline ───────────────────────────────────────────
     try:
-        result = run_tryon_pipeline_sync(
-            person_image_bytes=person_bytes,
-            clothing_image_bytes=clothing_bytes,
+        # Off the event loop, queued on the single pipeline thread
+        result = await run_in_pipeline_thread(
+            run_tryon_pipeline_sync,
+            person_image=person_pil,
+            clothing_image=clothing_pil,
             job_id=job_id,
             garment_category=garment_category,
         )
-        return JSONResponse({
+        # Encode / upload on a worker thread so the next queued run can start
+        result_image = result.pop("result_image")
+        output = await asyncio.to_thread(build_result_output, result_image, job_id)
+        # orjson serialises the multi-MB base64 result far faster than stdlib json
+        return ORJSONResponse({
             "job_id": job_id,
             "status": "completed",
             "garment_category": garment_category,
+            **output,
             **{k: v for k, v in result.items() if k != "job_id"},
         })
 
@@ -80,7 +101,6 @@ async def submit_tryon(
         )
 
     except Exception as exc:
-        import traceback
         logger.error("[%s] Unexpected error:\n%s", job_id, traceback.format_exc())
         raise HTTPException(
             status_code=500,
@@ -90,3 +110,31 @@ async def submit_tryon(
                 "job_id": job_id,
             },
         )
+
+
+@router.get("/{job_id}/image", summary="Fetch a stored try-on result")
+def get_tryon_image(job_id: str):
+    """
+    Redirect to the result image in S3 (cached presigned URL), so clients can
+    fetch the image directly instead of through a base64 JSON field.
+    404 when S3 storage is not configured, the id is not a UUID, or no result
+    was stored for it (e.g. the job fell back to an inline base64 result).
+    """
+    if not s3.is_configured():
+        _not_found(job_id, "Result storage is not configured.")
+    try:
+        job_id = str(uuid.UUID(job_id))  # canonical form – one cache key per job
+    except ValueError:
+        _not_found(job_id, "Unknown job id.")
+
+    key = s3.result_key(job_id)
+    if not s3.object_exists(key):
+        _not_found(job_id, "No stored result for this job.")
+    return RedirectResponse(s3.get_presigned_url(key), status_code=302)
+
+
+def _not_found(job_id: str, message: str):
+    raise HTTPException(
+        status_code=404,
+        detail={"error": "NOT_FOUND", "message": message, "job_id": job_id},
+    )
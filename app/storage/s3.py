@@ -2,59 +2,111 @@
 S3-compatible object storage adapter.
 Works with AWS S3, MinIO, Cloudflare R2, DigitalOcean Spaces.
 """
-import io
 import logging
-import uuid
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
 
 import boto3
 from botocore.config import Config
 from botocore.exceptions import ClientError
 from PIL import Image
 
-from app.config import get_settings
+from app.config import settings
+from app.utils.ids import uuid7
+from app.utils.image import save_options
 
 logger = logging.getLogger(__name__)
-settings = get_settings()
 
+# Presigned URLs by object key, reused until 80% of their lifetime has passed
+# so a cached URL never expires while a client is still fetching it
+_URL_CACHE_SIZE = 4096
+_url_cache: OrderedDict = OrderedDict()  # key -> (url, reuse_until)
+_url_cache_lock = threading.Lock()
 
+
+@lru_cache(maxsize=1)
 def _get_client():
+    """
+    Shared S3 client – boto3 clients are thread-safe, and every caller (pipeline
+    thread, request threadpool) draws from one warm pool sized by
+    s3_max_pool_connections.
+    """
     kwargs: dict = {
         "region_name": settings.aws_region,
         "aws_access_key_id": settings.aws_access_key_id or None,
         "aws_secret_access_key": settings.aws_secret_access_key or None,
-        "config": Config(signature_version="s3v4"),
+        "config": Config(
+            signature_version="s3v4",
+            max_pool_connections=settings.s3_max_pool_connections,
+            tcp_keepalive=True,
+            retries={"max_attempts": 3, "mode": "adaptive"},
+        ),
     }
     if settings.s3_endpoint_url:
         kwargs["endpoint_url"] = settings.s3_endpoint_url
-    return boto3.client("s3", **kwargs)
+    # Own Session: creating clients off boto3's default session isn't thread-safe
+    return boto3.session.Session().client("s3", **kwargs)
+
+
+def result_key(job_id: str) -> str:
+    """Object key under which a job's result image is stored."""
+    return f"results/{job_id}.png"
 
 
 def upload_image(image: Image.Image, key: str | None = None, fmt: str = "PNG") -> str:
     """Upload PIL image to S3 and return the object key."""
     if key is None:
-        key = f"results/{uuid.uuid4()}.png"
-    buf = io.BytesIO()
-    image.save(buf, format=fmt)
-    buf.seek(0)
-    client = _get_client()
-    client.put_object(
-        Bucket=settings.s3_bucket,
-        Key=key,
-        Body=buf,
-        ContentType=f"image/{fmt.lower()}",
-    )
+        key = f"results/{uuid7()}.png"
+    # Spills to disk past 4 MB; upload_fileobj goes through the transfer manager
+    # (multipart for large bodies) instead of one buffered put_object
+    with tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024) as buf:
+        image.save(buf, format=fmt, **save_options(fmt))
+        buf.seek(0)
+        _get_client().upload_fileobj(
+            buf,
+            settings.s3_bucket,
+            key,
+            ExtraArgs={"ContentType": f"image/{fmt.lower()}"},
+        )
     logger.info("Uploaded result to s3://%s/%s", settings.s3_bucket, key)
     return key
 
 
+def object_exists(key: str) -> bool:
+    """HEAD the object; False only when S3 says it isn't there."""
+    try:
+        _get_client().head_object(Bucket=settings.s3_bucket, Key=key)
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+            return False
+        raise
+    return True
+
+
 def get_presigned_url(key: str) -> str:
     """Generate a pre-signed URL valid for result_url_expiry_seconds."""
+    now = time.monotonic()
+    with _url_cache_lock:
+        cached = _url_cache.get(key)
+        if cached is not None and cached[1] > now:
+            _url_cache.move_to_end(key)
+            return cached[0]
+
     client = _get_client()
     url = client.generate_presigned_url(
         "get_object",
         Params={"Bucket": settings.s3_bucket, "Key": key},
         ExpiresIn=settings.result_url_expiry_seconds,
     )
+
+    with _url_cache_lock:
+        _url_cache[key] = (url, now + settings.result_url_expiry_seconds * 0.8)
+        _url_cache.move_to_end(key)
+        if len(_url_cache) > _URL_CACHE_SIZE:
+            _url_cache.popitem(last=False)
     return url
 
 
@@ -63,6 +115,8 @@ def delete_object(key: str) -> None:
     try:
         client = _get_client()
         client.delete_object(Bucket=settings.s3_bucket, Key=key)
+        with _url_cache_lock:
+            _url_cache.pop(key, None)
     except ClientError as exc:
         logger.error("Failed to delete s3://%s/%s: %s", settings.s3_bucket, key, exc)
 
@@ -0,0 +1,27 @@
+"""
+Time-ordered identifiers for jobs and stored results.
+"""
+import os
+import time
+import uuid
+
+
+def _uuid7() -> uuid.UUID:
+    """RFC 9562 UUIDv7: 48-bit Unix ms timestamp, then 74 random bits."""
+    ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = (ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76                          # version
+    value |= ((rand >> 62) & 0xFFF) << 64       # rand_a (12 bits)
+    value |= 0b10 << 62                         # variant
+    value |= rand & 0x3FFF_FFFF_FFFF_FFFF       # rand_b (62 bits)
+    return uuid.UUID(int=value)
+
+
+# Python 3.14+ ships uuid.uuid7 in C
+uuid7 = getattr(uuid, "uuid7", _uuid7)
+
+
+def new_job_id() -> str:
+    """Job id that sorts by creation time (S3 prefixes, logs, key scans)."""
+    return str(uuid7())
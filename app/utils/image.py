@@ -1,47 +1,133 @@
 """
 Image preprocessing utilities.
 """
+import asyncio
 import base64
 import io
 import logging
 from pathlib import Path
 
+import cv2
+import numpy as np
 from fastapi import UploadFile
 from PIL import Image, ImageOps
 
+from app.config import settings
+
 logger = logging.getLogger(__name__)
 
 ALLOWED_TYPES = {"image/jpeg", "image/png", "image/webp"}
-MAX_MB = 20
+MAX_MB = settings.max_upload_size_mb
+_READ_CHUNK = 64 * 1024
+_EXIF_ORIENTATION = 0x0112
 
 
-async def load_image_from_upload(upload: UploadFile) -> Image.Image:
-    """Read an UploadFile and return a PIL Image (RGB)."""
+async def load_image_from_upload(
+    upload: UploadFile, max_side: int | None = None
+) -> Image.Image:
+    """
+    Read an UploadFile and return a PIL Image (RGB).
+    With max_side, JPEGs are decoded at the smallest DCT scale (1/2, 1/4, 1/8)
+    that still covers max_side × max_side – only pass it for images that will be
+    downscaled to at most that size anyway.
+    """
     if upload.content_type not in ALLOWED_TYPES:
         raise ValueError(f"Unsupported image type: {upload.content_type}")
-    data = await upload.read()
-    if len(data) > MAX_MB * 1024 * 1024:
+    limit = MAX_MB * 1024 * 1024
+    if upload.size is not None and upload.size > limit:
         raise ValueError(f"Image exceeds {MAX_MB}MB limit")
-    img = Image.open(io.BytesIO(data)).convert("RGB")
-    return img
+    # Read in chunks so an oversized body is rejected without buffering it all
+    buf = bytearray()
+    while chunk := await upload.read(_READ_CHUNK):
+        buf.extend(chunk)
+        if len(buf) > limit:
+            raise ValueError(f"Image exceeds {MAX_MB}MB limit")
+    # Decoding is CPU-bound – keep it off the event loop
+    return await asyncio.to_thread(_decode_rgb, buf, max_side)
+
+
+def _decode_rgb(data: bytes | bytearray, max_side: int | None = None) -> Image.Image:
+    try:
+        img = Image.open(io.BytesIO(data))
+        if max_side:
+            # No-op for non-JPEG; square request so either orientation fits
+            img.draft("RGB", (max_side, max_side))
+        img.load()  # decode now so corrupt uploads fail here
+    except (OSError, SyntaxError) as exc:
+        raise ValueError("Could not decode image") from exc
+    return ensure_mode(img, "RGB")
+
+
+def ensure_mode(image: Image.Image, mode: str) -> Image.Image:
+    """Return image in mode, skipping the copy .convert() makes when it already is."""
+    return image if image.mode == mode else image.convert(mode)
+
+
+def shrink_to_fit(image: Image.Image, max_size: tuple) -> Image.Image:
+    """
+    Aspect-preserving downscale to fit within max_size (w, h), like
+    Image.thumbnail but on OpenCV's SIMD/multi-threaded INTER_AREA path.
+    Returns the input unchanged if it already fits.
+    """
+    mw, mh = max_size
+    w, h = image.size
+    scale = min(mw / w, mh / h)
+    if scale >= 1:
+        return image
+    new_size = (max(1, round(w * scale)), max(1, round(h * scale)))
+
+    if image.mode not in ("RGB", "L"):
+        return image.resize(new_size, Image.LANCZOS)
+    # INTER_AREA is the right filter for downsampling (no ringing/aliasing)
+    arr = cv2.resize(np.asarray(image), new_size, interpolation=cv2.INTER_AREA)
+    return Image.fromarray(arr)  # uint8 HxW → L, HxWx3 → RGB
+
+
+def exif_upright(image: Image.Image) -> Image.Image:
+    """ImageOps.exif_transpose, minus the full copy it makes when no rotation is needed."""
+    if image.getexif().get(_EXIF_ORIENTATION, 1) == 1:
+        return image
+    return ImageOps.exif_transpose(image)
+
+
+def resize_and_pad(image: Image.Image, size: tuple, margin: float = 1.0) -> Image.Image:
+    """
+    Shrink image to fit within margin × size (aspect preserved, never upscaled),
+    then center it on a white RGB canvas of exactly size (w, h).
+    """
+    tw, th = size
+    image = shrink_to_fit(image, (int(tw * margin), int(th * margin)))
+    if image.size == (tw, th) and image.mode == "RGB":
+        return image  # already exact – no canvas alloc + paste
+
+    canvas = Image.new("RGB", (tw, th), (255, 255, 255))
+    x_off = (tw - image.width) // 2
+    y_off = (th - image.height) // 2
+    canvas.paste(image, (x_off, y_off))
+    return canvas
 
 
 def resize_to_square(image: Image.Image, size: int = 1024) -> Image.Image:
     """Pad and resize image to exactly (size x size) maintaining aspect ratio."""
-    image = ImageOps.exif_transpose(image)  # fix EXIF rotation
-    image.thumbnail((size, size), Image.LANCZOS)
-    square = Image.new("RGB", (size, size), (255, 255, 255))
-    x_off = (size - image.width) // 2
-    y_off = (size - image.height) // 2
-    square.paste(image, (x_off, y_off))
-    return square
+    image = exif_upright(image)  # fix EXIF rotation
+    return resize_and_pad(image, (size, size))
+
+
+def save_options(fmt: str) -> dict:
+    """Image.save kwargs used for every result encode (inline or S3)."""
+    if fmt.upper() == "PNG":
+        # zlib level 6 (PIL default) spends most of the encode time compressing;
+        # level 1 is several times faster for a slightly larger file
+        return {"compress_level": 1}
+    return {"quality": 95}
 
 
 def encode_image_base64(image: Image.Image, fmt: str = "JPEG") -> str:
     """Encode PIL image to base64 string (fallback when S3 unavailable)."""
     buf = io.BytesIO()
-    image.save(buf, format=fmt, quality=95)
-    return base64.b64encode(buf.getvalue()).decode("utf-8")
+    image.save(buf, format=fmt, **save_options(fmt))
+    # getbuffer() exposes the bytes without the getvalue() copy
+    return base64.b64encode(buf.getbuffer()).decode("ascii")
 
 
 def image_to_bytes(image: Image.Image, fmt: str = "PNG") -> bytes:
@@ -69,7 +69,7 @@ pip install accelerate==0.31.0 \
 
 # ── 6. Server dependencies ───────────────────────────────────
 echo "[6/7] Installing server dependencies..."
-pip install fastapi uvicorn python-multipart python-dotenv boto3 aiofiles
+pip install fastapi uvicorn python-multipart python-dotenv boto3 aiofiles orjson
 
 # ── 7. Verify GPU ────────────────────────────────────────────
 echo "[7/7] Verifying GPU access..."